@@ -1,10 +1,11 @@
 import json
+import os
 from pathlib import Path
 
 DATASET_DIR = Path("CBench")
 
 
-def get_test_files(dir: Path) -> list[Path]:
+def get_test_files(dir: Path) -> list[str]:
     """
     Retrieve all test files in a directory.
 
@@ -15,37 +16,46 @@ def get_test_files(dir: Path) -> list[Path]:
         dir (Path): The path to the directory.
 
     Returns:
-        list[Path]: The list of test files.
+        list[str]: The test files as POSIX paths relative to `dir`.
     """
-    test_files: set[Path] = set()
+    test_files: list[str] = []
 
-    for subdir in ["test", "tests"]:
-        test_dir = dir / subdir
-        if test_dir.exists():
-            test_files.update(test_dir.rglob("*.c"))
+    # Walk the tree once instead of globbing it once per pattern.
+    for root, _, files in os.walk(dir):
+        relative_root = Path(root).relative_to(dir)
+        parts = relative_root.parts
+        in_test_dir = bool(parts) and parts[0] in ("test", "tests")
 
-    test_files.update(dir.rglob("*test*.c"))
+        for file in files:
+            if file.endswith(".c") and (in_test_dir or "test" in file):
+                test_files.append((relative_root / file).as_posix())
 
-    return test_files
+    return sorted(test_files)
 
 
 programs_metadata = []
 
-for program_dir in DATASET_DIR.iterdir():
-    if not program_dir.is_dir:
-        continue
+# `os.scandir` reuses the entry type from the directory listing, so checking
+# for directories needs no extra `stat` call per entry.
+with os.scandir(DATASET_DIR) as entries:
+    for entry in entries:
+        if not entry.is_dir():
+            continue
 
-    test_files = [
-        file.relative_to(program_dir).as_posix()
-        for file in get_test_files(program_dir)
-    ]
-    program_metadata = {
-        "name": program_dir.stem,
-        "path": program_dir.as_posix(),
-        "tests": test_files,
-    }
+        program_dir = Path(entry.path)
+        test_files = get_test_files(program_dir)
+        program_metadata = {
+            "name": program_dir.stem,
+            "path": program_dir.as_posix(),
+            "tests": test_files,
+        }
 
-    programs_metadata.append(program_metadata)
+        programs_metadata.append(program_metadata)
 
+# Directory listing order is platform dependent; sort once so the output is
+# stable (case-insensitively, matching the existing `crust_metadata.json`).
+programs_metadata.sort(key=lambda program: program["name"].upper())
+
+output = json.dumps({"programs": programs_metadata})
 with open("crust_metadata.json", "w") as file:
-    json.dump({"programs": programs_metadata}, file)
+    file.write(output)
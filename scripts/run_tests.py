@@ -11,17 +11,28 @@ For each program listed in `crust_metadata.json`, it:
   5. Collects and summarizes results in `test_results.json`.
 
 Usage:
-    python crust_test_runner.py
+    python crust_test_runner.py [--parallel N] [--fail-fast]
 """
 
+import argparse
 import json
+import os
 import subprocess
-from enum import Enum, auto
+from collections import Counter
+from collections.abc import Iterator
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from dataclasses import asdict, dataclass, field
+from enum import Enum, StrEnum, auto
+from itertools import islice
 from pathlib import Path
 
 # Path to the metadata file containing program info.
 METADATA_FILE = Path("crust_metadata.json")
 
+# Default number of programs processed at once. A couple of cores are left
+# free since `make` and `cargo` may themselves run jobs in parallel.
+DEFAULT_PARALLEL = max(1, (os.cpu_count() or 1) - 2)
+
 
 class Stage(Enum):
     """Enumeration of distinct build/test stages in the transpilation pipeline."""
@@ -44,12 +55,74 @@ class Stage(Enum):
         return names[self]
 
 
-def run_command(command: str, path: str) -> tuple[bool, str]:
+class Status(StrEnum):
+    """Outcome of a program or test, serialized as its plain string value."""
+
+    PASSED = "passed"
+    FAILED = "failed"
+    SKIPPED = "skipped"
+
+
+@dataclass(slots=True)
+class TestResult:
+    """Result of linking and running a single test against the Rust library."""
+
+    name: str
+    status: Status = Status.PASSED
+    stage_failed: str = ""
+    error: str = ""
+
+
+@dataclass(slots=True)
+class ProgramResult:
+    """Result of running the whole pipeline for a single program."""
+
+    program: str
+    status: Status = Status.PASSED
+    stage_failed: str = ""
+    error: str = ""
+    tests: list[TestResult] = field(default_factory=list)
+
+
+def is_compile_db_fresh(path: Path) -> bool:
     """
-    Run a shell command in a given directory.
+    Check whether a program's `compile_commands.json` is newer than its sources.
+
+    The C build only exists to produce the compilation database for `c2rust`,
+    so it can be skipped when no C source, header or Makefile has changed
+    since the database was written. Cargo's `target` directory is not scanned.
+    Files that cannot be stat'ed (e.g. dangling symlinks) count as changed.
 
     Args:
-        command (str): The shell command to execute.
+        path (Path): The program directory.
+
+    Returns:
+        bool: True if the compilation database can be reused.
+    """
+    try:
+        db_mtime = (path / "compile_commands.json").stat().st_mtime
+    except OSError:
+        return False
+
+    for root, dirs, files in os.walk(path):
+        dirs[:] = [d for d in dirs if d != "target"]
+        for file in files:
+            if file.endswith((".c", ".h")) or file == "Makefile":
+                try:
+                    mtime = os.stat(os.path.join(root, file)).st_mtime
+                except OSError:
+                    return False
+                if mtime >= db_mtime:
+                    return False
+    return True
+
+
+def run_command(command: list[str], path: str) -> tuple[bool, str]:
+    """
+    Run a command in a given directory without going through a shell.
+
+    Args:
+        command (list[str]): The program and its arguments.
         path (str): The working directory where the command is run.
 
     Returns:
@@ -57,155 +130,326 @@ def run_command(command: str, path: str) -> tuple[bool, str]:
             - True and empty string if successful.
             - False and stderr output if the command fails.
     """
-    result = subprocess.run(
-        command, cwd=path, capture_output=True, text=True, shell=True
-    )
-    return result.returncode == 0, result.stderr
-
-
-def run_stage(stage: Stage, command: str, path: str, result_dict: dict) -> bool:
+    try:
+        # Stdout is never reported, so don't buffer it (cargo and gcc are chatty).
+        result = subprocess.run(
+            command, cwd=path, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+        )
+    except OSError as e:
+        # Without a shell, a missing executable raises instead of exiting 127.
+        return False, str(e)
+
+    if result.returncode != 0:
+        return False, result.stderr.decode("utf-8", errors="replace")
+    return True, ""
+
+
+def run_stage(
+    stage: Stage, command: list[str], path: str, result: ProgramResult | TestResult
+) -> bool:
     """
-    Run a build/test stage and update the result dictionary if it fails.
+    Run a build/test stage and update the result if it fails.
 
-    Note that `result_dict` is mutated with the new results.
+    Note that `result` is mutated with the new results.
 
     Args:
         stage (Stage): The current pipeline stage.
-        command (str): The command to execute for this stage.
+        command (list[str]): The command to execute for this stage.
         path (str): The working directory.
-        result_dict (dict): The dictionary tracking program or test results.
+        result (ProgramResult | TestResult): The program or test result.
 
     Returns:
         bool: True if the stage succeeded, False if it failed.
     """
     success, error = run_command(command, path)
     if not success:
-        result_dict.update(status="failed", stage_failed=str(stage), error=error)
+        result.status = Status.FAILED
+        result.stage_failed = str(stage)
+        result.error = error
         return False
     return True
 
 
-def run_tests(metadata_file: Path):
+def process_program(program: dict) -> ProgramResult:
+    """
+    Run every pipeline stage for a single program.
+
+    Programs are independent of one another, so this is usually executed in a
+    worker process; all commands run with the program directory as their `cwd`.
+
+    Args:
+        program (dict): A program entry from the metadata file.
+
+    Returns:
+        ProgramResult: The result of the program and each of its tests.
+    """
+    name = program["name"]
+    path = Path(program["path"])
+    tests = program["tests"]
+
+    program_result = ProgramResult(program=name)
+
+    # Flush so progress from pool workers isn't held back when stdout is a file.
+    print(f"Processing '{name}'", flush=True)
+
+    # Without tests nothing exercises the Rust library, so skip building it.
+    if not tests:
+        program_result.status = Status.SKIPPED
+        return program_result
+
+    # Stage 1: Build C code with Bear, unless the compilation database from a
+    # previous run is still up to date. `make -B` rebuilds every target, since
+    # an incremental build would leave Bear with a partial database.
+    if not is_compile_db_fresh(path) and not run_stage(
+        Stage.C_BUILD, ["bear", "--", "make", "-B"], path, program_result
+    ):
+        # Bear may still write a partial database; never reuse it.
+        (path / "compile_commands.json").unlink(missing_ok=True)
+        return program_result
+
+    # Stage 2: Transpile C to Rust
+    if not run_stage(
+        Stage.TRANSPILE,
+        ["c2rust", "transpile", "--emit-build-files", "compile_commands.json"],
+        path,
+        program_result,
+    ):
+        return program_result
+
+    # Stage 3: Build transpiled Rust
+    if not run_stage(
+        Stage.RUST_BUILD,
+        ["cargo", "build", "--release"],
+        path,
+        program_result,
+    ):
+        return program_result
+
+    # Stage 4–5: Link and run tests
+    for test in tests:
+        test_path = Path(test)
+        test_name = f"c2rust_{test_path.stem}"
+        test_result = TestResult(name=test)
+
+        # TODO:
+        # Test C program on their own tests.
+        # Test Rust program on the transpiled tests.
+
+        # Link C test binary against Rust library
+        if not run_stage(
+            Stage.RUST_LINK,
+            [
+                "gcc",
+                "-o",
+                test_name,
+                test,
+                "-Isrc",
+                "-Ltarget/release",
+                "-lc2rust_out",
+                "-ldl",
+                "-lpthread",
+                "-lm",
+            ],
+            path,
+            test_result,
+        ):
+            program_result.status = Status.FAILED
+            program_result.stage_failed = str(Stage.RUST_LINK)
+            program_result.tests.append(test_result)
+            break
+
+        # Execute linked test binary
+        if not run_stage(
+            Stage.RUST_TEST,
+            [f"./{test_name}"],
+            path,
+            test_result,
+        ):
+            program_result.status = Status.FAILED
+            program_result.stage_failed = str(Stage.RUST_TEST)
+            program_result.tests.append(test_result)
+            break
+
+        program_result.tests.append(test_result)
+
+    return program_result
+
+
+def iter_program_results(
+    programs: list[dict], parallel: int, fail_fast: bool = False
+) -> Iterator[ProgramResult]:
+    """
+    Process programs and yield their results in completion order.
+
+    Args:
+        programs (list[dict]): Program entries from the metadata file.
+        parallel (int): Number of worker processes. With 1, programs are
+            processed sequentially in this process, which eases debugging.
+        fail_fast (bool): Start no new programs after the first failure.
+            Programs already running are still finished and yielded.
+
+    Yields:
+        ProgramResult: The result of each program as soon as it finishes.
+    """
+    if parallel <= 1:
+        for program_result in map(process_program, programs):
+            yield program_result
+            if fail_fast and program_result.status is Status.FAILED:
+                print(f"Stopping after '{program_result.program}' failed", flush=True)
+                return
+        return
+
+    # Submit one program per free worker rather than all of them up front: the
+    # executor marks queued calls as running, after which they can't be
+    # cancelled, so fail-fast could not stop them.
+    remaining = iter(programs)
+    stopping = False
+
+    with ProcessPoolExecutor(max_workers=parallel) as executor:
+        in_flight: set[Future[ProgramResult]] = {
+            executor.submit(process_program, program)
+            for program in islice(remaining, parallel)
+        }
+        while in_flight:
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                program_result = future.result()
+                yield program_result
+
+                if fail_fast and not stopping and program_result.status is Status.FAILED:
+                    stopping = True
+                    print(
+                        f"Stopping after '{program_result.program}' failed; "
+                        f"waiting for {len(in_flight)} program(s) already started",
+                        flush=True,
+                    )
+
+                if not stopping and (program := next(remaining, None)) is not None:
+                    in_flight.add(executor.submit(process_program, program))
+
+
+def run_tests(
+    metadata_file: Path, parallel: int = DEFAULT_PARALLEL, fail_fast: bool = False
+):
     """
     Run the entire C-to-Rust transpilation and testing pipeline.
 
-    Reads `metadata_file` for program definitions, executes each stage,
-    and writes a detailed summary to `test_results.json`.
+    Reads `metadata_file` for program definitions, executes each program's
+    stages in a pool of worker processes, and writes a detailed summary to
+    `test_results.json`. Each program's result is also appended to
+    `test_results.jsonl` as soon as it finishes, so progress survives a crash.
 
     Args:
         metadata_file (Path): Path to a JSON file with program metadata.
+        parallel (int): Number of programs to process at once.
+        fail_fast (bool): Start no new programs after the first failure.
+            Programs already running are still finished and reported; those
+            never started are reported as skipped.
     """
-    overall_results = []
+    results: dict[str, ProgramResult] = {}
 
     with open(metadata_file) as file:
         metadata = json.load(file)
 
     try:
-        for program in metadata["programs"]:
-            name = program["name"]
-            path = Path(program["path"])
-            tests = program["tests"]
-
-            program_result = {
-                "program": name,
-                "status": "passed",
-                "stage_failed": "",
-                "error": "",
-                "tests": [],
-            }
-
-            print(f"Processing '{name}'")
-
-            # Stage 1: Build C code with Bear
-            if not run_stage(Stage.C_BUILD, "bear -- make", path, program_result):
-                overall_results.append(program_result)
-                continue
-
-            # Stage 2: Transpile C to Rust
-            if not run_stage(
-                Stage.TRANSPILE,
-                "c2rust transpile --emit-build-files compile_commands.json",
-                path,
-                program_result,
+        with open("test_results.jsonl", "w") as log:
+            for program_result in iter_program_results(
+                metadata["programs"], parallel, fail_fast
             ):
-                overall_results.append(program_result)
-                continue
-
-            # Stage 3: Build transpiled Rust
-            if not run_stage(
-                Stage.RUST_BUILD,
-                "cargo build --release",
-                path,
-                program_result,
-            ):
-                overall_results.append(program_result)
-                continue
-
-            # Stage 4–5: Link and run tests
-            for test in tests:
-                test_path = Path(test)
-                test_name = f"c2rust_{test_path.stem}"
-                test_result = {"name": test, "status": "passed"}
-
-                # TODO:
-                # Test C program on their own tests.
-                # Test Rust program on the transpiled tests.
-
-                # Link C test binary against Rust library
-                if not run_stage(
-                    Stage.RUST_LINK,
-                    f"gcc -o {test_name} {test} -Isrc -Ltarget/release -lc2rust_out -ldl -lpthread -lm",
-                    path,
-                    test_result,
-                ):
-                    program_result.update(
-                        status="failed", stage_failed=str(Stage.RUST_LINK)
-                    )
-                    program_result["tests"].append(test_result)
-                    break
-
-                # Execute linked test binary
-                if not run_stage(
-                    Stage.RUST_TEST,
-                    f"./{test_name}",
-                    path,
-                    test_result,
-                ):
-                    program_result.update(
-                        status="failed", stage_failed=str(Stage.RUST_TEST)
-                    )
-                    program_result["tests"].append(test_result)
-                    break
-
-                program_result["tests"].append(test_result)
-
-            overall_results.append(program_result)
+                results[program_result.program] = program_result
+                log.write(json.dumps(asdict(program_result)) + "\n")
+                log.flush()
 
     except Exception as e:
         print(f"Unexpected error: {e}")
 
     finally:
-        # Summary statistics
-        total_programs = len(overall_results)
-        programs_passed = sum(1 for r in overall_results if r["status"] == "passed")
-        programs_failed = total_programs - programs_passed
-
-        failed_at = {str(stage): 0 for stage in Stage}
+        # Keep the order of the metadata file regardless of completion order.
+        # Programs that never ran (fail-fast or an error) are listed as skipped
+        # so a stopped run can't pass for a complete one.
+        overall_results = [
+            results.get(program["name"])
+            or ProgramResult(
+                program=program["name"],
+                status=Status.SKIPPED,
+                error="not run: the run stopped early",
+            )
+            for program in metadata["programs"]
+        ]
+        programs_not_run = len(overall_results) - len(results)
+
+        # Summary statistics, gathered in a single pass over the results
+        programs_passed = programs_skipped = 0
+        failed_at = Counter({str(stage): 0 for stage in Stage})
         for program_result in overall_results:
-            if program_result["status"] == "failed":
-                stage = program_result["stage_failed"]
-                failed_at[stage] = failed_at.get(stage, 0) + 1
+            if program_result.status is Status.PASSED:
+                programs_passed += 1
+            elif program_result.status is Status.SKIPPED:
+                programs_skipped += 1
+            else:
+                failed_at[program_result.stage_failed] += 1
+
+        total_programs = len(overall_results)
+        programs_failed = total_programs - programs_passed - programs_skipped
 
         summary = {
             "total_programs": total_programs,
             "programs_passed": programs_passed,
             "programs_failed": programs_failed,
+            "programs_skipped": programs_skipped,
+            "programs_not_run": programs_not_run,
             **{f"failed_at_{stage}": count for stage, count in failed_at.items()},
         }
 
+        # `json.dumps` uses the C encoder; `json.dump` streams chunks through the
+        # pure Python one.
+        output = json.dumps(
+            {
+                "summary": summary,
+                "overall_results": [asdict(r) for r in overall_results],
+            }
+        )
         with open("test_results.json", "w") as file:
-            json.dump({"summary": summary, "overall_results": overall_results}, file)
+            file.write(output)
+
+
+def positive_int(value: str) -> int:
+    """
+    Parse a command-line argument as an integer of at least 1.
+
+    Args:
+        value (str): The raw argument value.
+
+    Returns:
+        int: The parsed value.
+
+    Raises:
+        argparse.ArgumentTypeError: If `value` is not an integer of at least 1.
+    """
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"expected an integer >= 1, got {value!r}")
+    return number
 
 
 if __name__ == "__main__":
-    run_tests(METADATA_FILE)
+    parser = argparse.ArgumentParser(description="Run the C2Rust test pipeline.")
+    parser.add_argument(
+        "--parallel",
+        type=positive_int,
+        default=DEFAULT_PARALLEL,
+        metavar="N",
+        help="number of programs to process at once; 1 runs them sequentially "
+        f"in this process (default: {DEFAULT_PARALLEL})",
+    )
+    parser.add_argument(
+        "--fail-fast",
+        action="store_true",
+        help="stop after the first program that fails",
+    )
+    args = parser.parse_args()
+
+    run_tests(METADATA_FILE, parallel=args.parallel, fail_fast=args.fail_fast)